@@ -1,22 +1,47 @@
 # agent_tools/file_tool.py
+import asyncio
+import codecs
+import os
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterator
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]  # adjust if needed; ensures safe base
 
+MAX_READ_BYTES = 1_048_576  # read_file returns at most this much content
+CHUNK_SIZE = 64 * 1024
+
 def safe_path(path: str) -> Path:
     p = (PROJECT_ROOT / path).resolve()
-    if PROJECT_ROOT not in p.parents and p != PROJECT_ROOT:
+    if not p.is_relative_to(PROJECT_ROOT):
         raise PermissionError("Attempt to access outside project root")
     return p
 
-def read_file(path: str) -> Dict:
+def iter_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Yield a file's text in chunk_size pieces without loading it whole."""
+    p = safe_path(path)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with p.open("rb") as f:
+        while chunk := f.read(chunk_size):
+            yield decoder.decode(chunk)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def read_file(path: str, max_bytes: int | None = MAX_READ_BYTES) -> Dict:
     try:
         p = safe_path(path)
-        if not p.exists():
+        try:
+            with p.open("rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                truncated = max_bytes is not None and size > max_bytes
+                data = f.read(max_bytes) if truncated else f.read()
+        except FileNotFoundError:
             return {"ok": False, "error": "not_found", "content": ""}
-        content = p.read_text(encoding="utf-8")
-        return {"ok": True, "content": content}
+        if truncated:
+            # Only return the head; use iter_chunks() to consume the rest
+            content = data.decode("utf-8", errors="replace")
+            return {"ok": True, "content": content, "truncated": True, "size": size}
+        return {"ok": True, "content": data.decode("utf-8")}
     except Exception as e:
         return {"ok": False, "error": str(e), "content": ""}
 
@@ -29,3 +54,11 @@ def write_file(path: str, content: str, create_dirs: bool = False) -> Dict:
         return {"ok": True}
     except Exception as e:
         return {"ok": False, "error": str(e)}
+
+# Async variants: run the blocking disk I/O in a worker thread so the
+# event loop keeps serving other streams meanwhile.
+async def aread_file(path: str) -> Dict:
+    return await asyncio.to_thread(read_file, path)
+
+async def awrite_file(path: str, content: str, create_dirs: bool = False) -> Dict:
+    return await asyncio.to_thread(write_file, path, content, create_dirs)
@@ -1,7 +1,13 @@
 # agent_tools/github_tool.py — Clean, production-ready GitHub wrapper
 import os
 import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,11 +25,35 @@ if not GITHUB_TOKEN:
 
 GITHUB_API = "https://api.github.com"
 
+# Max concurrent page fetches in list_repos (kept below the session pool size)
+MAX_PAGE_WORKERS = 8
+
 HEADERS = {
     "Authorization": f"token {GITHUB_TOKEN}",
     "Accept": "application/vnd.github.v3+json",
 }
 
+# -------------------------------------------------------------------
+# SHARED SESSION (keep-alive connection pool)
+# -------------------------------------------------------------------
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        # raise_on_status=False: once retries run out, hand back the last
+        # 5xx response instead of raising RetryError
+        max_retries=Retry(
+            total=3, backoff_factor=0.2, status_forcelist=(502, 503, 504), raise_on_status=False,
+        ),
+    ),
+)
+
+# Async client for callers running on the event loop (same auth headers)
+ASYNC_CLIENT = httpx.AsyncClient(headers=HEADERS, timeout=15)
+
 
 # -------------------------------------------------------------------
 # SAFE REQUEST WRAPPER
@@ -31,7 +61,7 @@ HEADERS = {
 def _safe_request(method, url, **kwargs):
     """Small wrapper to avoid exceptions and unify return format."""
     try:
-        r = requests.request(method, url, headers=HEADERS, timeout=15, **kwargs)
+        r = SESSION.request(method, url, timeout=15, **kwargs)
 
         try:
             data = r.json()
@@ -42,19 +72,53 @@ def _safe_request(method, url, **kwargs):
             "ok": r.status_code in (200, 201, 204),
             "status": r.status_code,
             "data": data,
+            "links": r.links,
+            "headers": r.headers,
         }
     except Exception as e:
-        return {"ok": False, "error": str(e), "status": None}
+        return {"ok": False, "error": str(e), "status": None, "data": str(e)}
+
+
+# -------------------------------------------------------------------
+# METADATA CACHE
+# Within the TTL the cached value is returned without a request; after
+# it, a conditional GET (If-None-Match → 304, no body) revalidates it.
+# -------------------------------------------------------------------
+DEFAULT_BRANCH_TTL = 3600  # seconds
+BRANCHES_TTL = 60
+
+# (owner, repo) -> (etag, default_branch, fetched_at)
+_REPO_META: dict[tuple[str, str], tuple[str | None, str, float]] = {}
+# (owner, repo) -> (etag, branches, fetched_at)
+_BRANCHES_META: dict[tuple[str, str], tuple[str | None, list, float]] = {}
+
+
+def _is_fresh(cached, ttl: float) -> bool:
+    return cached is not None and time.monotonic() - cached[2] < ttl
+
+
+def _if_none_match(cached):
+    return {"If-None-Match": cached[0]} if cached and cached[0] else {}
 
 
 # -------------------------------------------------------------------
 # DEFAULT BRANCH
 # -------------------------------------------------------------------
 def get_default_branch(owner: str, repo: str) -> str:
+    key = (owner, repo)
+    cached = _REPO_META.get(key)
+    if _is_fresh(cached, DEFAULT_BRANCH_TTL):
+        return cached[1]
+
     url = f"{GITHUB_API}/repos/{owner}/{repo}"
-    r = _safe_request("GET", url)
+    r = _safe_request("GET", url, headers=_if_none_match(cached))
+    if cached and r["status"] == 304:
+        _REPO_META[key] = (cached[0], cached[1], time.monotonic())
+        return cached[1]
     if r["ok"]:
-        return r["data"].get("default_branch", "main")
+        branch = r["data"].get("default_branch", "main")
+        _REPO_META[key] = (r["headers"].get("ETag"), branch, time.monotonic())
+        return branch
     return "main"
 
 
@@ -81,11 +145,14 @@ def create_repository(name: str, description: str = "", private: bool = False):
 # -------------------------------------------------------------------
 # CREATE / UPDATE FILE (README, etc.)
 # -------------------------------------------------------------------
-def create_or_update_file(owner: str, repo: str, path: str, content: str, message: str):
+def create_or_update_file(owner: str, repo: str, path: str, content: str, message: str,
+                          branch: str | None = None):
+    """Pass `branch` when writing several files to skip the default-branch lookup."""
     if not owner or not repo or not path:
         return {"ok": False, "error": "Missing owner/repo/path"}
 
-    branch = get_default_branch(owner, repo)
+    if branch is None:
+        branch = get_default_branch(owner, repo)
 
     # Fetch existing file SHA
     url = f"{GITHUB_API}/repos/{owner}/{repo}/contents/{path}"
@@ -103,38 +170,53 @@ def create_or_update_file(owner: str, repo: str, path: str, content: str, messag
             body["sha"] = sha
 
     # PUT create/update
-    resp = requests.put(url, headers=HEADERS, json=body)
-
-    try:
-        data = resp.json()
-    except Exception:
-        data = resp.text
+    resp = _safe_request("PUT", url, json=body)
+    ok = resp["status"] in (200, 201)
 
-    ok = resp.status_code in (200, 201)
-
-    return {"ok": ok, "status": resp.status_code, "data": data}
+    return {"ok": ok, "status": resp["status"], "data": resp["data"]}
 
 
 # -------------------------------------------------------------------
 # AUTHENTICATED LIST OF ALL REPOS (private + public)
 # PAGINATION INCLUDED
 # -------------------------------------------------------------------
+def _last_page(links: dict) -> int:
+    """Read the page number out of the Link: rel="last" header (1 if absent)."""
+    last_url = (links or {}).get("last", {}).get("url")
+    if not last_url:
+        return 1
+    try:
+        return int(parse_qs(urlparse(last_url).query)["page"][0])
+    except (KeyError, IndexError, ValueError):
+        return 1
+
+
 def list_repos(username: str | None = None):
     """
     If token exists → use authenticated /user/repos (private + public)
-    Paginated by 100 per page.
+    Paginated by 100 per page. The first page tells us the last page
+    number; the remaining pages are fetched concurrently.
     """
     repos = []
     per_page = 100
-    page = 1
 
     # Use authenticated endpoint ALWAYS if token is present
     url = f"{GITHUB_API}/user/repos"
 
-    while True:
-        params = {"per_page": per_page, "page": page}
-        r = _safe_request("GET", url, params=params)
+    def fetch(page):
+        return _safe_request("GET", url, params={"per_page": per_page, "page": page})
+
+    first = fetch(1)
+    if not first["ok"]:
+        return {"ok": False, "status": first.get("status"), "error": first.get("data")}
 
+    responses = [first]
+    last = _last_page(first.get("links"))
+    if last > 1:
+        with ThreadPoolExecutor(max_workers=min(MAX_PAGE_WORKERS, last - 1)) as pool:
+            responses.extend(pool.map(fetch, range(2, last + 1)))
+
+    for r in responses:
         if not r["ok"]:
             return {"ok": False, "status": r.get("status"), "error": r.get("data")}
 
@@ -151,12 +233,6 @@ def list_repos(username: str | None = None):
                 "html_url": repo.get("html_url"),
             })
 
-        # Pagination exit condition
-        if len(data) < per_page:
-            break
-
-        page += 1
-
     return {
         "ok": True,
         "total": len(repos),
@@ -168,11 +244,20 @@ def list_repos(username: str | None = None):
 # LIST BRANCHES
 # -------------------------------------------------------------------
 def list_branches(owner: str, repo: str):
+    key = (owner, repo)
+    cached = _BRANCHES_META.get(key)
+    if _is_fresh(cached, BRANCHES_TTL):
+        return {"ok": True, "branches": list(cached[1])}
+
     url = f"{GITHUB_API}/repos/{owner}/{repo}/branches"
-    r = _safe_request("GET", url)
+    r = _safe_request("GET", url, headers=_if_none_match(cached))
+    if cached and r["status"] == 304:
+        _BRANCHES_META[key] = (cached[0], cached[1], time.monotonic())
+        return {"ok": True, "branches": list(cached[1])}
     if r["ok"]:
         branches = [b.get("name") for b in r["data"]]
-        return {"ok": True, "branches": branches}
+        _BRANCHES_META[key] = (r["headers"].get("ETag"), branches, time.monotonic())
+        return {"ok": True, "branches": list(branches)}
 
     return {"ok": False, "status": r["status"], "error": r["data"]}
 
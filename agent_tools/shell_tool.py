@@ -1,34 +1,133 @@
 # agent_tools/shell_tool.py
 import asyncio
+import codecs
+import re
 import shlex
-from typing import Dict
+from collections import deque
+from typing import AsyncIterator, Dict, Tuple
 
 # Whitelisted commands (prefix match allowed). Expand as needed.
 WHITELIST = [
     "ls", "pwd", "cat", "echo", "git status", "git rev-parse", "git log", "python", "pip", "npm", "pytest"
 ]
+# Whole-word prefix match against any whitelisted command, compiled once
+_WHITELIST_RE = re.compile(r"^(?:" + "|".join(re.escape(w) for w in WHITELIST) + r")(?:\s|$)")
 
-async def run_shell(command: str, cwd: str = ".", timeout: int = 20) -> Dict:
+MAX_COMMAND_LENGTH = 1024
+MAX_OUTPUT_BYTES = 64 * 1024   # run_shell keeps only this much of each stream (the tail)
+READ_CHUNK = 64 * 1024         # stream_shell reads pipes in blocks of this size
+STREAM_QUEUE_SIZE = 8          # blocks buffered ahead of a slow stream_shell consumer
+
+
+class CommandNotAllowed(Exception):
+    pass
+
+
+class _Tail:
+    """Keeps the last max_chars characters of appended chunks."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.chunks = deque()
+        self.size = 0
+        self.truncated = False
+
+    def append(self, chunk: str):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        while self.size > self.max_chars:
+            # drop chunks wholly outside the window, trim the one straddling it
+            excess = self.size - self.max_chars
+            if len(self.chunks[0]) <= excess:
+                self.size -= len(self.chunks.popleft())
+            else:
+                self.chunks[0] = self.chunks[0][excess:]
+                self.size -= excess
+            self.truncated = True
+
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
+async def stream_shell(command: str, cwd: str = ".", timeout: int = 20) -> AsyncIterator[Tuple[str, str]]:
+    """Yield ("stdout" | "stderr", text) pairs as the command produces output.
+
+    Output is read in READ_CHUNK blocks, so a piece may hold several lines
+    or part of one; very long lines are never dropped.
+
+    Raises CommandNotAllowed for non-whitelisted commands and
+    asyncio.TimeoutError (after killing the process) when timeout expires.
+    """
     # Normalize
     cmd_trim = command.strip()
-    # basic safety: check whitelist (prefix match)
-    allowed = any(cmd_trim.startswith(w) for w in WHITELIST)
+    # basic safety: cheap length guard, then whitelist (prefix match)
+    allowed = len(cmd_trim) <= MAX_COMMAND_LENGTH and _WHITELIST_RE.match(cmd_trim) is not None
     if not allowed:
-        return {"ok": False, "error": "command_not_whitelisted", "stdout": "", "stderr": "Command not allowed"}
+        raise CommandNotAllowed(cmd_trim)
 
     # Build args
     args = shlex.split(cmd_trim)
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            *args, cwd=cwd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+    proc = await asyncio.create_subprocess_exec(
+        *args, cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    # Bounded: pumps stop reading (and the pipe fills) while the consumer lags
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    async def pump(name, stream):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
         try:
-            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
-        except asyncio.TimeoutError:
+            while chunk := await stream.read(READ_CHUNK):
+                await queue.put((name, decoder.decode(chunk)))
+        except asyncio.CancelledError:
+            raise  # consumer is gone; nobody waits for the end marker
+        except Exception as e:
+            await queue.put((name, e))  # re-raised by the consumer
+            return
+        await queue.put((name, None))
+
+    pumps = [
+        asyncio.create_task(pump("stdout", proc.stdout)),
+        asyncio.create_task(pump("stderr", proc.stderr)),
+    ]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        open_streams = len(pumps)
+        while open_streams:
+            name, chunk = await asyncio.wait_for(queue.get(), deadline - loop.time())
+            if chunk is None:
+                open_streams -= 1
+                continue
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield name, chunk
+        await asyncio.wait_for(proc.wait(), deadline - loop.time())
+    finally:
+        if proc.returncode is None:
             proc.kill()
-            return {"ok": False, "error": "timeout", "stdout": "", "stderr": "Command timed out"}
-        return {"ok": True, "stdout": stdout.decode(errors="ignore"), "stderr": stderr.decode(errors="ignore")}
+            await proc.wait()
+        for task in pumps:
+            task.cancel()
+
+
+async def run_shell(command: str, cwd: str = ".", timeout: int = 20, max_bytes: int = MAX_OUTPUT_BYTES) -> Dict:
+    """Run a command to completion, returning the tail of stdout/stderr."""
+    out, err = _Tail(max_bytes), _Tail(max_bytes)
+    try:
+        async for name, chunk in stream_shell(command, cwd=cwd, timeout=timeout):
+            (out if name == "stdout" else err).append(chunk)
+    except CommandNotAllowed:
+        return {"ok": False, "error": "command_not_whitelisted", "stdout": "", "stderr": "Command not allowed"}
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": "timeout", "stdout": out.text(), "stderr": "Command timed out"}
     except Exception as e:
         return {"ok": False, "error": "exec_error", "stdout": "", "stderr": str(e)}
+    return {
+        "ok": True,
+        "stdout": out.text(),
+        "stderr": err.text(),
+        "truncated": out.truncated or err.truncated,
+    }
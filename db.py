@@ -6,5 +6,12 @@ MONGO_URI = os.getenv("MONGODB_URI")
 if not MONGO_URI:
     raise RuntimeError("MONGODB_URI is not set")
 
-client = AsyncIOMotorClient(MONGO_URI)
+# Single client (and connection pool) per process — import `db` from here only
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    maxPoolSize=50,
+    minPoolSize=5,
+    serverSelectionTimeoutMS=5000,
+    uuidRepresentation="standard",
+)
 db = client["devops_ai"]
@@ -1,15 +1,20 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
 
 class Message(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     role: str
     content: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=utcnow)
 
 class Chat(BaseModel):
     id: Optional[str] = None          # For returning to client
     title: str = "New Chat"
     messages: List[Message] = Field(default_factory=list)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    
\ No newline at end of file
+    created_at: datetime = Field(default_factory=utcnow)
@@ -1,5 +1,8 @@
 import asyncio
-import json
+import logging
+import os
+import orjson
+from datetime import datetime, timezone
 from uuid import uuid4
 from fastapi import FastAPI, Query, HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse
@@ -12,6 +15,9 @@ from simplechat_agent import agent
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from db import db
 
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 # ------------------ CORS ------------------
@@ -31,6 +37,22 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Agent output is buffered and written to Mongo every N chunks (and at the end)
+FLUSH_EVERY_CHUNKS = 32
+
+# Max SSE frames buffered between the agent task and the client socket
+SSE_QUEUE_SIZE = 64
+_END = object()  # end-of-stream sentinel on the SSE queue
+
+# Cursor batch size for listing chats (Motor's default first batch is 101 docs)
+CHATS_BATCH_SIZE = 200
+
+
+def sse(event: str, payload) -> bytes:
+    """Encode one SSE frame; StreamingResponse sends bytes as-is."""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(payload) + b"\n\n"
+
+
 # ------------------ Models ------------------
 class ChatRequest(BaseModel):
     message: str
@@ -39,8 +61,12 @@ class ChatRequest(BaseModel):
 
 # ------------------ Create Chat ------------------
 @app.post("/chat/create")
-async def create_chat():    
-    result = await db.chats.insert_one({"title": "New Chat", "messages": []})
+async def create_chat():
+    result = await db.chats.insert_one({
+        "title": "New Chat",
+        "messages": [],
+        "created_at": datetime.now(timezone.utc),
+    })
     return {"chat_id": str(result.inserted_id)}
 
 
@@ -50,13 +76,12 @@ async def create_chat():
 @app.get("/agent/stream")
 async def agent_stream(message: str = Query(...), chat_id: str = Query(...)):
     # Validate chat_id
-    try:
-        oid = ObjectId(chat_id)
-    except:
+    if not ObjectId.is_valid(chat_id):
         return StreamingResponse(
             iter(["event: error\ndata: Invalid chat_id\n\n"]),
             media_type="text/event-stream"
         )
+    oid = ObjectId(chat_id)
 
     chat = await db.chats.find_one({"_id": oid})
     if not chat:
@@ -76,44 +101,61 @@ async def agent_stream(message: str = Query(...), chat_id: str = Query(...)):
     # Add user message
     history.append(HumanMessage(content=message))
 
-    # Save user message in DB
-    await db.chats.update_one(
-        {"_id": oid},
-        {"$push": {"messages": {"role": "user", "content": message}}}
-    )
+    # User message is persisted together with the agent reply (see _flush)
+    user_msg = {"role": "user", "content": message, "timestamp": datetime.now(timezone.utc)}
 
     # -----------------------------------------------------
-    #                 SSE STREAMING LOOP
+    #          PRODUCER: agent run + DB persistence
     # -----------------------------------------------------
-    async def event_generator():
+    # Frames go through a bounded queue so the agent (and DB flushes) run
+    # ahead of the socket instead of pausing between yields.
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+
+    async def produce():
+        assistant_buf = []
+        pending = [user_msg]
+        chunks = 0
+
+        async def _flush():
+            # One round trip for everything buffered since the last flush
+            if assistant_buf:
+                pending.append({
+                    "role": "agent",
+                    "content": "".join(assistant_buf),
+                    "timestamp": datetime.now(timezone.utc),
+                })
+                assistant_buf.clear()
+            if not pending:
+                return
+            await db.chats.update_one(
+                {"_id": oid},
+                {"$push": {"messages": {"$each": list(pending)}}}
+            )
+            pending.clear()
+
         try:
             async for step in agent.astream(input={"messages": history}):
 
-                print("DEBUG step:", step)  # REMOVE after testing
+                logger.debug("step: %r", step)
 
                 # --------------------------
                 # TOOL CALL
                 # --------------------------
                 if "tool_call" in step:
-                    yield (
-                        "event: tool_call\n"
-                        f"data: {json.dumps(step['tool_call'])}\n\n"
-                    )
+                    await queue.put(sse("tool_call", step["tool_call"]))
 
                 # --------------------------
                 # TOOL RESULT (OUTPUT)
                 # --------------------------
                 if "tool_result" in step:
-                    yield (
-                        "event: tool_output\n"
-                        f"data: {json.dumps(step['tool_result'])}\n\n"
-                    )
+                    await queue.put(sse("tool_output", step["tool_result"]))
 
                 # --------------------------
-                # LLM NODE MESSAGE (AI Output)
+                # LLM / FORMAT NODE MESSAGE (AI Output)
                 # --------------------------
-                if "llm_node" in step:
-                    msgs = step["llm_node"].get("messages", [])
+                node_out = step.get("llm_node") or step.get("format_node")
+                if node_out:
+                    msgs = node_out.get("messages", [])
 
                     for m in msgs:
                         content = getattr(m, "content", "")
@@ -121,32 +163,57 @@ async def agent_stream(message: str = Query(...), chat_id: str = Query(...)):
                             continue
 
                         # Send incremental assistant message to UI
-                        yield (
-                            "event: message\n"
-                            f"data: {json.dumps({'content': content})}\n\n"
-                        )
-
-                        # Save in DB
-                        await db.chats.update_one(
-                            {"_id": oid},
-                            {
-                                "$push": {
-                                    "messages": {
-                                        "role": "agent",
-                                        "content": content
-                                    }
-                                }
-                            }
-                        )
+                        await queue.put(sse("message", {"content": content}))
+
+                        # Buffer for DB, flushed periodically and at the end
+                        assistant_buf.append(content)
+                        chunks += 1
+                        if chunks % FLUSH_EVERY_CHUNKS == 0:
+                            await _flush()
+
+            await _flush()
 
             # --------------------------
             # END STREAM
             # --------------------------
-            yield "event: end\ndata: done\n\n"
+            await queue.put(b"event: end\ndata: done\n\n")
+
+        except asyncio.CancelledError:
+            # Client went away mid-run: still save the user message and
+            # whatever reply was produced, then let the cancellation through
+            try:
+                await asyncio.shield(_flush())
+            except Exception:
+                logger.exception("failed to save chat messages")
+            raise
 
         except Exception as e:
-            print("STREAM ERROR:", e)
-            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            logger.exception("stream error")
+            await queue.put(sse("error", {"error": str(e)}))
+            # Keep whatever was produced before the failure
+            try:
+                await _flush()
+            except Exception:
+                logger.exception("failed to save chat messages")
+
+        # Not reached on cancellation — nobody is left to read it then
+        await queue.put(_END)
+
+    # -----------------------------------------------------
+    #           CONSUMER: SSE STREAMING LOOP
+    # -----------------------------------------------------
+    async def event_generator():
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is _END:
+                    break
+                yield frame
+        finally:
+            # Client went away: stop the agent run
+            if not producer.done():
+                producer.cancel()
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -157,10 +224,9 @@ async def chat(payload: ChatRequest):
     if payload.chat_id is None:
         raise HTTPException(status_code=400, detail="chat_id is required")
 
-    try:
-        oid = ObjectId(payload.chat_id)
-    except Exception:
+    if not ObjectId.is_valid(payload.chat_id):
         raise HTTPException(status_code=400, detail="Invalid chat_id")
+    oid = ObjectId(payload.chat_id)
 
     chat = await db.chats.find_one({"_id": oid})
     if not chat:
@@ -175,17 +241,16 @@ async def chat(payload: ChatRequest):
 
     history.append(HumanMessage(content=payload.message))
 
-    result = chatbot.invoke({"messages": history})
+    result = await chatbot.ainvoke({"messages": history})
     reply = result["messages"][-1].content
 
+    now = datetime.now(timezone.utc)
     await db.chats.update_one(
         {"_id": oid},
-        {"$push": {"messages": {"role": "user", "content": payload.message}}}
-    )
-
-    await db.chats.update_one(
-        {"_id": oid},
-        {"$push": {"messages": {"role": "agent", "content": reply}}}
+        {"$push": {"messages": {"$each": [
+            {"role": "user", "content": payload.message, "timestamp": now},
+            {"role": "agent", "content": reply, "timestamp": now},
+        ]}}}
     )
 
     return {"chat_id": payload.chat_id, "reply": reply}
@@ -193,18 +258,43 @@ async def chat(payload: ChatRequest):
 
 # ------------------ Get All Chats ------------------
 @app.get("/chats")
-async def get_chats():
+async def get_chats(
+    limit: int = Query(100, ge=1, le=500),
+    before: str | None = Query(None),
+):
+    # Newest first; pass the last id of a page as `before` to get the next one
+    query = {}
+    if before is not None:
+        if not ObjectId.is_valid(before):
+            raise HTTPException(status_code=400, detail="Invalid before")
+        query["_id"] = {"$lt": ObjectId(before)}
+
+    docs = await (
+        db.chats.find(query, projection={"title": 1})
+        .sort("_id", -1)
+        .limit(limit)
+        .batch_size(CHATS_BATCH_SIZE)
+        .to_list(length=None)
+    )
     return [
         {"id": str(chat["_id"]), "title": chat.get("title", "New Chat")}
-        async for chat in db.chats.find()
+        for chat in docs
     ]
 
 
 # ------------------ Get Single Chat ------------------
 @app.get("/chat/{chat_id}")
-async def get_chat(chat_id: str):
-    oid = ObjectId(chat_id) 
-    chat = await db.chats.find_one({"_id": oid})
+async def get_chat(chat_id: str, limit: int = Query(50, ge=1, le=500)):
+    if not ObjectId.is_valid(chat_id):
+        raise HTTPException(status_code=400, detail="Invalid chat_id")
+    oid = ObjectId(chat_id)
+    # Only the last `limit` messages come off the wire
+    chat = await db.chats.find_one(
+        {"_id": oid},
+        projection={"title": 1, "messages": {"$slice": -limit}}
+    )
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
     return {
         "id": str(chat["_id"]),
         "title": chat.get("title", "New Chat"),
@@ -215,6 +305,8 @@ async def get_chat(chat_id: str):
 # ------------------ Delete Chat ------------------
 @app.delete("/chat/{chat_id}")
 async def delete_chat(chat_id: str):
+    if not ObjectId.is_valid(chat_id):
+        raise HTTPException(status_code=400, detail="Invalid chat_id")
     oid = ObjectId(chat_id)
     await db.chats.delete_one({"_id": oid})
     return {"success": True}
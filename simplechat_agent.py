@@ -1,18 +1,24 @@
 # simplechat_agent.py — Clean production-ready agent
-from datetime import datetime
 from langgraph.graph import StateGraph, START, END
 from langchain_groq import ChatGroq
 from typing import TypedDict, Annotated, List
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, BaseMessage
-import json, re, os, time
+import asyncio, re, os, time
+from collections import deque
+import orjson
 from dotenv import load_dotenv
-import requests
+
+try:
+    import ahocorasick  # optional (pyahocorasick): one-pass keyword scan in the router
+except ImportError:
+    ahocorasick = None
 
 # Tools (must exist in agent_tools package)
-from agent_tools.file_tool import read_file, write_file
+from agent_tools.file_tool import aread_file, awrite_file
 from agent_tools.shell_tool import run_shell
 from agent_tools.github_tool import (
-    HEADERS,
+    ASYNC_CLIENT,
+    GITHUB_API,
     create_or_update_file,
     create_pull_request,
     create_repository,
@@ -23,8 +29,13 @@ from agent_tools.github_tool import (
 
 load_dotenv()
 
+# Environment read once at import (after .env is loaded)
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+GITHUB_OWNER = os.getenv("GITHUB_OWNER") or None
+GITHUB_REPO = os.getenv("GITHUB_REPO") or None
+
 # Initialize LLM
-llm = ChatGroq(model=os.getenv("LLM_MODEL", "llama-3.1-8b-instant"))
+llm = ChatGroq(model=LLM_MODEL)
 
 # -------------------------
 # Normalizer
@@ -39,7 +50,7 @@ def normalize_message(m) -> BaseMessage:
             return HumanMessage(content=content)
         if role in ("assistant", "ai"):
             return AIMessage(content=content)
-        return SystemMessage(content=content or json.dumps(m))
+        return SystemMessage(content=content or orjson.dumps(m, default=str, option=orjson.OPT_NON_STR_KEYS).decode())
     if isinstance(m, str):
         return HumanMessage(content=m)
     return SystemMessage(content=str(m))
@@ -47,123 +58,303 @@ def normalize_message(m) -> BaseMessage:
 # -------------------------
 # State
 # -------------------------
+MAX_HISTORY = 12  # messages kept in state (and sent to the LLM)
+
 class ChatState(TypedDict):
     messages: Annotated[List[BaseMessage], ...]
     tool_call: dict | None
     tool_result: dict | None
 
+# -------------------------
+# Router patterns (compiled once at import)
+# -------------------------
+# Intent detection runs on the lower-cased message: a cheap substring check
+# on the literal phrases first, the regex only confirms word boundaries
+KW_READ_FILE = ("read file", "readfile", "show file", "open file")
+KW_WRITE_FILE = ("write file", "create file", "add file", "update file", "edit file")
+KW_CREATE_REPO = ("create repo", "make repo", "make a repo", "new repo")
+KW_LIST_REPOS = ("list repos", "show repos", "my github repos", "repositories")
+KW_UPDATE_README = ("update readme",)
+KW_CREATE_PR = ("create pr", "create pull request", "open pr", "open pull request", "make a pull request")
+KW_LIST_BRANCHES = ("branches",)
+KW_PUSH = ("push my code", "push code", "push repo")
+KW_FIX_REPO = ("fix my repo", "fix repo", "make tests pass", "run tests")
+
+# Generic shell intent is decided on whole words instead (lowest priority)
+SHELL_WORDS = frozenset({"execute", "shell", "pytest", "npm"})
+SHELL_LEADING = frozenset({"ls", "git"})  # only as the first word
+WORD_PUNCT = ".,;:!?()[]{}\"'`"
+
+RE_READ_FILE = re.compile(r"\bread file\b|\breadfile\b|\bshow file\b|\bopen file\b")
+RE_WRITE_FILE = re.compile(r"\bwrite file\b|\bcreate file\b|\badd file\b|\bupdate file\b|\bedit file\b")
+RE_CREATE_REPO = re.compile(r"\bcreate repo\b|\bcreate repository\b|\bmake (?:a )?repo\b|\bnew repo\b")
+RE_LIST_REPOS = re.compile(r"\blist repos\b|\bshow repos\b|\bmy github repos\b|\brepositories\b")
+RE_UPDATE_README = re.compile(r"\bupdate readme\b")
+RE_CREATE_PR = re.compile(r"\bcreate pr\b|\bcreate pull request\b|\bopen pr\b|\bopen pull request\b|\bmake a pull request\b")
+RE_LIST_BRANCHES = re.compile(r"\blist branches\b|\bshow branches\b|\bbranches\b")
+RE_PUSH = re.compile(r"\bpush my code\b|\bpush code\b|\bpush repo\b")
+RE_FIX_REPO = re.compile(r"\bfix my repo\b|\bfix repo\b|\bmake tests pass\b|\brun tests\b")
+
+# Argument extraction runs on the original message
+RE_REPO_NAME = re.compile(r"(?:repo|repository|repo called|repo named)\s+([A-Za-z0-9._-]+)", re.I)
+RE_README = re.compile(r"update readme (?:for\s+([A-Za-z0-9_-]+/[A-Za-z0-9_-]+))?(?: with|:)?\s*(.+)?", re.I)
+
+def _detect(lm: str, keywords, pattern) -> bool:
+    """Only run `pattern` when one of its literal phrases occurs in lm."""
+    return any(k in lm for k in keywords) and pattern.search(lm) is not None
+
+# -------------------------
+# Argument tokenizer (str.find / partition instead of capture regexes)
+# `lm` is the lower-cased msg with identical indexes
+# -------------------------
+WRITE_VERBS = ("write ", "create ", "update ", "edit ")
+NAME_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-")
+SLUG_CHARS = NAME_CHARS | {"/"}
+
+def _after_verb(lm: str, verbs) -> int:
+    """Index just past the earliest verb (and an optional "file "), or -1."""
+    hits = [(i, v) for v in verbs if (i := lm.find(v)) >= 0]
+    if not hits:
+        return -1
+    i, verb = min(hits)
+    j = i + len(verb)
+    if lm.startswith("file ", j):
+        j += len("file ")
+    return j
+
+def _slug_prefix(word: str) -> str:
+    n = 0
+    while n < len(word) and word[n] in SLUG_CHARS:
+        n += 1
+    return word[:n]
+
+def parse_owner_repo(s: str):
+    """First "owner/repo" slug in s as (owner, repo), or None."""
+    i = s.find("/")
+    while i >= 0:
+        left = i
+        while left > 0 and s[left - 1] in NAME_CHARS:
+            left -= 1
+        right = i + 1
+        while right < len(s) and s[right] in NAME_CHARS:
+            right += 1
+        if left < i and right > i + 1:
+            return s[left:i], s[i + 1:right]
+        i = s.find("/", i + 1)
+    return None
+
+def _parse_from_to(msg: str):
+    """("from X to Y") -> (X, Y); (None, None) when absent."""
+    words = msg.split()
+    for k in range(len(words) - 3):
+        if words[k] == "from" and words[k + 2] == "to":
+            head, base = words[k + 1], _slug_prefix(words[k + 3])
+            if base and _slug_prefix(head) == head:
+                return head, base
+    return None, None
+
+# -------------------------
+# Router intent handlers (build the tool_call from the original message)
+# -------------------------
+def _route_read_file(msg: str, lm: str):
+    # read file path
+    j = _after_verb(lm, ("read ",))
+    path = (msg[j:].strip() or None) if j >= 0 else None
+    return {"tool_call": {"tool": "file", "args": {"action": "read", "path": path, "text": msg}}}
+
+def _route_write_file(msg: str, lm: str):
+    # format: write file <path>: <content>
+    path, content = None, None
+    j = _after_verb(lm, WRITE_VERBS)
+    if j >= 0:
+        head, sep, tail = msg[j:].partition(":")
+        if sep and head and tail.strip():
+            path, content = head.strip(), tail.strip()
+        else:
+            # fallback: path only
+            path = msg[j:].strip() or None
+    return {"tool_call": {"tool": "file", "args": {"action": "write", "path": path, "content": content, "text": msg}}}
+
+def _route_create_repo(msg: str, lm: str):
+    m = RE_REPO_NAME.search(msg)
+    name = m.group(1) if m else None
+    return {"tool_call": {"tool": "github", "args": {"action": "create_repo", "name": name, "text": msg}}}
+
+def _route_list_repos(msg: str, lm: str):
+    return {"tool_call": {"tool": "github", "args": {"action": "list_repos", "text": msg}}}
+
+def _route_update_readme(msg: str, lm: str):
+    # try to capture repo and content
+    m = RE_README.search(msg)
+    repo_spec = m.group(1) if m and m.group(1) else None
+    content = m.group(2).strip() if m and m.group(2) else None
+    owner, repo = None, None
+    if repo_spec:
+        owner, repo = parse_owner_repo(repo_spec)
+    return {"tool_call": {"tool": "github", "args": {"action": "update_file", "owner": owner, "repo": repo, "path": "README.md", "content": content, "text": msg}}}
+
+def _route_create_pr(msg: str, lm: str):
+    # phrases like "create pr from X to Y in owner/repo"
+    owner_repo = parse_owner_repo(msg)
+    head, base = _parse_from_to(msg)
+    owner = owner_repo[0] if owner_repo else GITHUB_OWNER
+    repo = owner_repo[1] if owner_repo else GITHUB_REPO
+    return {"tool_call": {"tool": "github", "args": {"action": "create_pr", "owner": owner, "repo": repo, "head": head, "base": base, "text": msg}}}
+
+def _route_list_branches(msg: str, lm: str):
+    owner_repo = parse_owner_repo(msg) or (GITHUB_OWNER, GITHUB_REPO)
+    owner = owner_repo[0]
+    repo = owner_repo[1]
+    return {"tool_call": {"tool": "github", "args": {"action": "list_branches", "owner": owner, "repo": repo, "text": msg}}}
+
+def _route_push(msg: str, lm: str):
+    # safe: only inspects status, never pushes
+    return {"tool_call": {"tool": "shell", "args": {"action": "push_intent", "command": "git status -b", "text": msg}}}
+
+def _route_fix_repo(msg: str, lm: str):
+    return {"tool_call": {"tool": "repo", "args": {"action": "fix_repo", "text": msg}}}
+
+def _is_shell(words) -> bool:
+    """Shell intent: ls/git as the first word, or any SHELL_WORDS word."""
+    if not words:
+        return False
+    if words[0].strip(WORD_PUNCT) in SHELL_LEADING:
+        return True
+    return not SHELL_WORDS.isdisjoint(w.strip(WORD_PUNCT) for w in words)
+
+def _route_shell(msg: str, lm: str):
+    # prefer explicit "run: <cmd>" syntax
+    i = lm.find("run:")
+    cmd = (msg[i + len("run:"):].strip() if i >= 0 else "") or msg
+    return {"tool_call": {"tool": "shell", "args": {"action": "exec", "command": cmd, "text": msg}}}
+
+# intent -> (keywords, pattern, handler), in priority order; the generic
+# "shell" intent comes last and is matched by _is_shell instead
+INTENTS = {
+    "read_file": (KW_READ_FILE, RE_READ_FILE, _route_read_file),
+    "write_file": (KW_WRITE_FILE, RE_WRITE_FILE, _route_write_file),
+    "create_repo": (KW_CREATE_REPO, RE_CREATE_REPO, _route_create_repo),
+    "list_repos": (KW_LIST_REPOS, RE_LIST_REPOS, _route_list_repos),
+    "update_readme": (KW_UPDATE_README, RE_UPDATE_README, _route_update_readme),
+    "create_pr": (KW_CREATE_PR, RE_CREATE_PR, _route_create_pr),
+    "list_branches": (KW_LIST_BRANCHES, RE_LIST_BRANCHES, _route_list_branches),
+    "push": (KW_PUSH, RE_PUSH, _route_push),
+    "fix_repo": (KW_FIX_REPO, RE_FIX_REPO, _route_fix_repo),
+}
+
+# All intents as named groups of one pattern: a single pass over the
+# message reports every intent present (match.lastgroup names it)
+RE_MASTER = re.compile("|".join(
+    f"(?P<{name}>{pattern.pattern})" for name, (_, pattern, _) in INTENTS.items()
+))
+
+# Aho-Corasick automaton over every intent's literal phrases: one linear
+# pass yields all candidate intents, each then confirmed by its regex
+def _build_keyword_automaton():
+    automaton = ahocorasick.Automaton()
+    for name, (keywords, _, _) in INTENTS.items():
+        for kw in keywords:
+            # a phrase may belong to several intents (e.g. "repo" ones)
+            automaton.add_word(kw, (*automaton.get(kw, ()), name))
+    automaton.make_automaton()
+    return automaton
+
+KEYWORD_AUTOMATON = _build_keyword_automaton() if ahocorasick else None
+
+def _intent_hits(lm: str) -> set:
+    """Names of all intents present in lm, in one pass."""
+    if KEYWORD_AUTOMATON is None:
+        return {m.lastgroup for m in RE_MASTER.finditer(lm)}
+    candidates = {name for _, names in KEYWORD_AUTOMATON.iter(lm) for name in names}
+    return {name for name in candidates if INTENTS[name][1].search(lm)}
+
+# first word -> the only intents a message starting with it can be; the
+# generic shell intent is never listed so it always stays lowest priority
+INTENT_DISPATCH = {
+    "read": ("read_file",),
+    "readfile": ("read_file",),
+    "show": ("read_file", "list_repos", "list_branches"),
+    "open": ("read_file", "create_pr"),
+    "write": ("write_file",),
+    "add": ("write_file",),
+    "create": ("write_file", "create_repo", "create_pr"),
+    "update": ("write_file", "update_readme"),
+    "edit": ("write_file", "update_readme"),
+    "make": ("create_repo", "create_pr", "fix_repo"),
+    "new": ("create_repo",),
+    "list": ("list_repos", "list_branches"),
+    "my": ("list_repos",),
+    "push": ("push",),
+    "fix": ("fix_repo",),
+    "run": ("fix_repo",),
+}
+
 # -------------------------
 # Router (strict single-action)
 # -------------------------
 def router_node(state: ChatState):
     """
-    Strict natural-language router:
-    - Tries specific intents in order.
-    - Returns a single tool_call dict or empty dict.
+    Graph entry point:
+    - Normalizes the incoming history once and keeps only the last
+      MAX_HISTORY messages, so later nodes use state["messages"] as-is.
+    - Routes the last message (see _route).
     """
-
-    last = state["messages"][-1] if state["messages"] else None
-    if last is None:
+    messages = deque(
+        map(normalize_message, deque(state.get("messages") or (), maxlen=MAX_HISTORY)),
+        maxlen=MAX_HISTORY,
+    )
+    if not messages:
         return {}
 
-    try:
-        msg = str(last.content).strip()
-    except Exception:
-        msg = str(last).strip()
+    # normalized messages almost always carry str content already
+    content = getattr(messages[-1], "content", messages[-1])
+    msg = content.strip() if isinstance(content, str) else str(content).strip()
 
-    lm = msg.lower()
+    return {"messages": messages, **_route(msg)}
 
-    # helper
-    def match(regex_list):
-        for r in regex_list:
-            if re.search(r, lm):
-                return True
-        return False
-
-    # 1) FILE: read/write/update/create
-    if match([r"\bread file\b", r"\breadfile\b", r"\bshow file\b", r"\bopen file\b"]):
-        # read file path
-        m = re.search(r"read (?:file )?(.+)$", msg, re.I)
-        path = m.group(1).strip() if m else None
-        return {"tool_call": {"tool": "file", "args": {"action": "read", "path": path, "text": msg}}}
-
-    if match([r"\bwrite file\b", r"\bcreate file\b", r"\badd file\b", r"\bupdate file\b", r"\bedit file\b"]):
-        # format: write file <path>: <content>
-        m = re.search(r"(?:write|create|update|edit) (?:file )?([^\:]+):\s*(.+)$", msg, re.I)
-        if m:
-            path = m.group(1).strip()
-            content = m.group(2).strip()
-        else:
-            # fallback: path only
-            mm = re.search(r"(?:write|create|update|edit) (?:file )?(.+)$", msg, re.I)
-            path = mm.group(1).strip() if mm else None
-            content = None
-        return {"tool_call": {"tool": "file", "args": {"action": "write", "path": path, "content": content, "text": msg}}}
-
-    # 2) GITHUB: create repo
-    if match([r"\bcreate repo\b", r"\bcreate repository\b", r"\bmake (?:a )?repo\b", r"\bnew repo\b"]):
-        m = re.search(r"(?:repo|repository|repo called|repo named)\s+([A-Za-z0-9._-]+)", msg, re.I)
-        name = m.group(1) if m else None
-        return {"tool_call": {"tool": "github", "args": {"action": "create_repo", "name": name, "text": msg}}}
-
-    # 3) GITHUB: list repos
-    if match([r"\blist repos\b", r"\bshow repos\b", r"\bmy github repos\b", r"\brepositories\b"]):
-        return {"tool_call": {"tool": "github", "args": {"action": "list_repos", "text": msg}}}
-
-    # 4) GITHUB: update readme
-    if match([r"\bupdate readme\b", r"\bupdate README\b", r"\bedit README.md\b"]):
-        # try to capture repo and content
-        m = re.search(r"update readme (?:for\s+([A-Za-z0-9_-]+/[A-Za-z0-9_-]+))?(?: with|:)?\s*(.+)?", msg, re.I)
-        repo_spec = m.group(1) if m and m.group(1) else None
-        content = m.group(2).strip() if m and m.group(2) else None
-        owner, repo = None, None
-        if repo_spec:
-            parts = repo_spec.split("/")
-            owner, repo = parts[0], parts[1]
-        return {"tool_call": {"tool": "github", "args": {"action": "update_file", "owner": owner, "repo": repo, "path": "README.md", "content": content, "text": msg}}}
-
-    # 5) GITHUB: create pull request (phrases like "create pr from X to Y in owner/repo")
-    if match([r"\bcreate pr\b", r"\bcreate pull request\b", r"\bopen pr\b", r"\bopen pull request\b", r"\bmake a pull request\b"]):
-        owner_repo = None
-        m = re.search(r"([A-Za-z0-9_-]+)/([A-Za-z0-9_-]+)", msg)
-        if m:
-            owner_repo = (m.group(1), m.group(2))
-        mm = re.search(r"from\s+([A-Za-z0-9_\-\/]+)\s+to\s+([A-Za-z0-9_\-\/]+)", msg)
-        head = mm.group(1) if mm else None
-        base = mm.group(2) if mm else None
-        owner = owner_repo[0] if owner_repo else (os.getenv("GITHUB_OWNER") or None)
-        repo = owner_repo[1] if owner_repo else (os.getenv("GITHUB_REPO") or None)
-        return {"tool_call": {"tool": "github", "args": {"action": "create_pr", "owner": owner, "repo": repo, "head": head, "base": base, "text": msg}}}
-
-    # 6) GITHUB: list branches
-    if match([r"\blist branches\b", r"\bshow branches\b", r"\bbranches\b"]):
-        m = re.search(r"([A-Za-z0-9_-]+)\/([A-Za-z0-9_-]+)", msg)
-        owner_repo = (m.group(1), m.group(2)) if m else (os.getenv("GITHUB_OWNER"), os.getenv("GITHUB_REPO"))
-        owner = owner_repo[0]
-        repo = owner_repo[1]
-        return {"tool_call": {"tool": "github", "args": {"action": "list_branches", "owner": owner, "repo": repo, "text": msg}}}
-
-    # 7) PUSH intent (safe)
-    if match([r"\bpush my code\b", r"\bpush code\b", r"\bpush repo\b"]):
-        return {"tool_call": {"tool": "shell", "args": {"action": "push_intent", "command": "git status -b", "text": msg}}}
-
-    # 8) REPO-WIDE fix
-    if match([r"\bfix my repo\b", r"\bfix repo\b", r"\bmake tests pass\b", r"\brun tests\b"]):
-        return {"tool_call": {"tool": "repo", "args": {"action": "fix_repo", "text": msg}}}
-
-    # 9) Generic shell execution (explicit)
-    if match([r"^\s*run\:", r"\bexecute\b", r"\bshell\b", r"^\s*ls\b", r"^\s*git\b", r"pytest", r"npm"]):
-        # prefer explicit "run: <cmd>" syntax
-        m = re.search(r"run:\s*(.+)$", msg, re.I)
-        cmd = m.group(1).strip() if m else msg
+def _route(msg: str):
+    """
+    Strict natural-language router:
+    - Looks up the intents allowed for the first word and tries only those.
+    - Otherwise tries every intent in priority order.
+    - Returns a single tool_call dict or empty dict.
+    """
+    # Fast path: explicit "run: <cmd>" needs no intent matching at all.
+    # It wins over every intent, so "run: fix my repo" is a shell exec.
+    if msg[:4].lower() == "run:":
+        cmd = msg[4:].strip() or msg
         return {"tool_call": {"tool": "shell", "args": {"action": "exec", "command": cmd, "text": msg}}}
 
+    lm = msg.lower()
+    if len(lm) != len(msg):
+        # rare non-ASCII case changes length; keep indexes aligned with msg
+        lm = "".join(c.lower() if len(c.lower()) == 1 else c for c in msg)
+
+    words = lm.split()
+    tried = INTENT_DISPATCH.get(words[0], ()) if words else ()
+    for name in tried:
+        keywords, pattern, handle = INTENTS[name]
+        if _detect(lm, keywords, pattern):
+            return handle(msg, lm)
+
+    # Fallback: intent phrase not at the start of the message
+    hits = _intent_hits(lm)
+    for name, (_, _, handle) in INTENTS.items():
+        if name in hits and name not in tried:
+            return handle(msg, lm)
+
+    # Lowest priority: generic shell execution
+    if _is_shell(words):
+        return _route_shell(msg, lm)
+
     # Default: no tool
     return {}
 
 # -------------------------
 # Tool Node (single tool execution)
 # -------------------------
+FIX_REPO_TIMEOUT = 60  # seconds, per command
+
 async def tool_node(state: ChatState):
     tc = state.get("tool_call")
     if not tc:
@@ -191,7 +382,7 @@ async def tool_node(state: ChatState):
         if action == "read":
             path = args.get("path") or args.get("text") or ""
             try:
-                res = read_file(path)
+                res = await aread_file(path)
             except Exception as e:
                 res = {"ok": False, "error": str(e)}
             return {"tool_result": {"tool": "file", "result": res}}
@@ -201,7 +392,7 @@ async def tool_node(state: ChatState):
             if not path:
                 return {"tool_result": {"tool": "file", "result": {"ok": False, "error": "missing_path"}}}
             try:
-                res = write_file(path, content, create_dirs=True)
+                res = await awrite_file(path, content, create_dirs=True)
             except Exception as e:
                 res = {"tool_result": {"tool": "file", "result": {"ok": False, "error": str(e)}}}
             return {"tool_result": {"tool": "file", "result": res}}
@@ -211,8 +402,8 @@ async def tool_node(state: ChatState):
         action = args.get("action")
         # LIST_REPOS
         if action == "list_repos":
-            username = args.get("username") or os.getenv("GITHUB_OWNER")
-            res = list_repos(username)
+            username = args.get("username") or GITHUB_OWNER
+            res = await asyncio.to_thread(list_repos, username)
             return {"tool_result": {"tool": "github", "result": res}}
 
         # CREATE_REPO
@@ -220,53 +411,58 @@ async def tool_node(state: ChatState):
             name = args.get("name")
             if not name:
                 return {"tool_result": {"tool": "github", "result": {"ok": False, "error": "missing_name"}}}
-            res = create_repository(name=name, description="Created by AI Agent", private=False)
+            res = await asyncio.to_thread(
+                create_repository, name=name, description="Created by AI Agent", private=False
+            )
             return {"tool_result": {"tool": "github", "result": res}}
 
         # UPDATE FILE (README)
         if action == "update_file":
-            owner = args.get("owner") or os.getenv("GITHUB_OWNER")
-            repo = args.get("repo") or os.getenv("GITHUB_REPO")
+            owner = args.get("owner") or GITHUB_OWNER
+            repo = args.get("repo") or GITHUB_REPO
             path = args.get("path") or "README.md"
             content = args.get("content") or args.get("text") or ""
             if not repo:
                 return {"tool_result": {"tool": "github", "result": {"ok": False, "error": "missing_repo"}}}
-            res = create_or_update_file(owner, repo, path, content, "Agent update")
+            res = await asyncio.to_thread(create_or_update_file, owner, repo, path, content, "Agent update")
             return {"tool_result": {"tool": "github", "result": res}}
 
         # CREATE PR
         if action == "create_pr":
-            owner = args.get("owner") or os.getenv("GITHUB_OWNER")
-            repo = args.get("repo") or os.getenv("GITHUB_REPO")
+            owner = args.get("owner") or GITHUB_OWNER
+            repo = args.get("repo") or GITHUB_REPO
             head = args.get("head")
             base = args.get("base")
             if not repo:
                 return {"tool_result": {"tool": "github", "result": {"ok": False, "error": "missing_repo"}}}
+            now = int(time.time())  # shared by the auto branch name and the title
             # attempt to auto-create head branch if absent (best-effort)
             if not head:
-                head = f"agent/auto-{int(time.time())}"
+                head = f"agent/auto-{now}"
                 try:
-                    br_url = f"https://api.github.com/repos/{owner}/{repo}/git/ref/heads/{base or 'main'}"
-                    r = requests.get(br_url, headers=HEADERS)
+                    br_url = f"{GITHUB_API}/repos/{owner}/{repo}/git/ref/heads/{base or 'main'}"
+                    r = await ASYNC_CLIENT.get(br_url)
                     if r.status_code == 200:
                         sha = r.json()["object"]["sha"]
-                        create_ref_url = f"https://api.github.com/repos/{owner}/{repo}/git/refs"
+                        create_ref_url = f"{GITHUB_API}/repos/{owner}/{repo}/git/refs"
                         payload = {"ref": f"refs/heads/{head}", "sha": sha}
-                        requests.post(create_ref_url, headers=HEADERS, json=payload)
+                        await ASYNC_CLIENT.post(create_ref_url, json=payload)
                 except Exception:
                     pass
-            title = args.get("title") or f"Automated PR by Agent: {datetime.utcnow().isoformat()}"
+            title = args.get("title") or f"Automated PR by Agent: {now}"
             body = args.get("body") or args.get("text") or ""
-            res = create_pull_request(owner, repo, head, base or get_default_branch(owner, repo), title, body)
+            if not base:
+                base = await asyncio.to_thread(get_default_branch, owner, repo)
+            res = await asyncio.to_thread(create_pull_request, owner, repo, head, base, title, body)
             return {"tool_result": {"tool": "github", "result": res}}
 
         # LIST_BRANCHES
         if action == "list_branches":
-            owner = args.get("owner") or os.getenv("GITHUB_OWNER")
-            repo = args.get("repo") or os.getenv("GITHUB_REPO")
+            owner = args.get("owner") or GITHUB_OWNER
+            repo = args.get("repo") or GITHUB_REPO
             if not repo:
                 return {"tool_result": {"tool": "github", "result": {"ok": False, "error": "missing_repo"}}}
-            res = list_branches(owner, repo)
+            res = await asyncio.to_thread(list_branches, owner, repo)
             return {"tool_result": {"tool": "github", "result": res}}
 
         return {"tool_result": {"tool": "github", "result": {"ok": False, "error": "unknown_action"}}}
@@ -275,11 +471,17 @@ async def tool_node(state: ChatState):
     if tool == "repo":
         action = args.get("action")
         if action == "fix_repo":
-            tests = await run_shell("pytest -q", cwd=".")
+            # Tests and lint are independent: run them side by side, each
+            # capped by run_shell's timeout
+            tests, lint = await asyncio.gather(
+                run_shell("pytest -q --maxfail=5", cwd=".", timeout=FIX_REPO_TIMEOUT),
+                run_shell("flake8 .", cwd=".", timeout=FIX_REPO_TIMEOUT),
+                return_exceptions=True,
+            )
+            if isinstance(tests, Exception):
+                tests = {"ok": False, "error": str(tests)}
             # flake8 may not be installed — handle gracefully
-            try:
-                lint = await run_shell("flake8 .", cwd=".")
-            except Exception:
+            if isinstance(lint, Exception):
                 lint = {"ok": False, "error": "flake8_not_available"}
             return {"tool_result": {"tool": "repo", "result": {"tests": tests, "lint": lint}}}
         return {"tool_result": {"tool": "repo", "result": {"ok": False, "error": "unknown_repo_action"}}}
@@ -289,6 +491,44 @@ async def tool_node(state: ChatState):
 # -------------------------
 # LLM Node (single final summarizer)
 # -------------------------
+def _clip(x, n: int = 1500, depth: int = 3):
+    """Shorten long string leaves (e.g. shell stdout) before serialising."""
+    if isinstance(x, str):
+        return x[:n] + "…" if len(x) > n else x
+    if depth <= 0:
+        return x
+    if isinstance(x, dict):
+        return {k: _clip(v, n, depth - 1) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [_clip(v, n, depth - 1) for v in x]
+    return x
+
+MAX_PROMPT_TOKENS = 2000  # rough budget for history sent to the LLM
+
+def _approx_tokens(m) -> int:
+    content = getattr(m, "content", "")
+    return len(content if isinstance(content, str) else str(content)) // 4
+
+def _token_window(history):
+    """Newest messages that fit MAX_PROMPT_TOKENS (always at least the last one)."""
+    picked, used = [], 0
+    for m in reversed(history):
+        used += _approx_tokens(m)
+        if picked and used > MAX_PROMPT_TOKENS:
+            break
+        picked.append(m)
+    picked.reverse()
+    return picked
+
+# Invariant prompt prefix, built once (also keeps it byte-identical across
+# turns for provider-side prefix caching)
+SYSTEM_PROMPT = SystemMessage(content=(
+    "You are an AI DevOps Assistant. Be concise and factual.\n"
+    "If a TOOL OUTPUT is provided, summarize the final result in one short line for the user.\n"
+    "Do NOT invent actions or repeat unrelated previous tool outputs.\n"
+    "If tool_result.ok is false, produce a short error message explaining why."
+))
+
 async def llm_node(state: ChatState):
     """
     Build prompt:
@@ -296,25 +536,16 @@ async def llm_node(state: ChatState):
     - Include limited history.
     - Append the last tool_result as TOOL_OUTPUT (stringified but small).
     """
-    raw_messages = state.get("messages", []) or []
+    history = state.get("messages") or ()
     tool_result = state.get("tool_result")
 
-    MAX_HISTORY = 12
-    history = raw_messages[-MAX_HISTORY:]
-
-    prompt_msgs = [SystemMessage(content=(
-        "You are an AI DevOps Assistant. Be concise and factual.\n"
-        "If a TOOL OUTPUT is provided, summarize the final result in one short line for the user.\n"
-        "Do NOT invent actions or repeat unrelated previous tool outputs.\n"
-        "If tool_result.ok is false, produce a short error message explaining why."
-    ))]
-
-    for m in history:
-        prompt_msgs.append(normalize_message(m))
+    # history is already normalized and capped by router_node; trim it
+    # further to the token budget
+    prompt_msgs = [SYSTEM_PROMPT, *_token_window(history)]
 
     if tool_result:
         # include only the last tool_result summary (not entire history)
-        truncated = json.dumps(tool_result, default=str)
+        truncated = orjson.dumps(_clip(tool_result), default=str, option=orjson.OPT_NON_STR_KEYS).decode()
         if len(truncated) > 2000:
             truncated = truncated[:2000] + "..."
         prompt_msgs.append(SystemMessage(content=f"TOOL_OUTPUT: {truncated}"))
@@ -338,6 +569,36 @@ async def llm_node(state: ChatState):
     cleaned = [normalize_message(m) for m in returned]
     return {"messages": cleaned}
 
+# -------------------------
+# Format Node (plain listings, no LLM round trip)
+# -------------------------
+DIRECT_ACTIONS = ("list_repos", "list_branches")
+
+def route_after_tool(state: ChatState):
+    """Successful list lookups are rendered directly; everything else is summarized."""
+    action = ((state.get("tool_call") or {}).get("args") or {}).get("action")
+    result = (state.get("tool_result") or {}).get("result") or {}
+    if action in DIRECT_ACTIONS and result.get("ok"):
+        return "format_node"
+    return "llm_node"
+
+def format_node(state: ChatState):
+    action = state["tool_call"]["args"]["action"]
+    result = state["tool_result"]["result"]
+
+    if action == "list_repos":
+        repos = result.get("repositories", [])
+        lines = [f"Found {result.get('total', len(repos))} repositories:"]
+        for r in repos:
+            private = " (private)" if r.get("private") else ""
+            lines.append(f"- {r.get('full_name') or r.get('name')}{private}")
+    else:
+        branches = result.get("branches", [])
+        lines = [f"Found {len(branches)} branches:"]
+        lines.extend(f"- {b}" for b in branches)
+
+    return {"messages": [AIMessage(content="\n".join(lines))]}
+
 # -------------------------
 # Build Graph
 # -------------------------
@@ -345,10 +606,16 @@ graph = StateGraph(ChatState)
 graph.add_node("router_node", router_node)
 graph.add_node("tool_node", tool_node)
 graph.add_node("llm_node", llm_node)
+graph.add_node("format_node", format_node)
 
 graph.add_edge(START, "router_node")
 graph.add_edge("router_node", "tool_node")
-graph.add_edge("tool_node", "llm_node")
+graph.add_conditional_edges(
+    "tool_node",
+    route_after_tool,
+    {"llm_node": "llm_node", "format_node": "format_node"},
+)
 graph.add_edge("llm_node", END)
+graph.add_edge("format_node", END)
 
 agent = graph.compile()